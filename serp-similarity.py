@@ -1,11 +1,19 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import re
+import orjson
+import functools
 import pandas as pd
+import numpy as np
 from typing import Dict, Any, List, Set
 from urllib.parse import urlparse
-import numpy as np
 from datetime import datetime
+import math
+
+# Rows shown per page in the result tables
+PAGE_SIZE = 10
 
 # Set page configuration
 st.set_page_config(
@@ -16,8 +24,7 @@ st.set_page_config(
 )
 
 # Streamlined Custom CSS
-st.markdown("""
-    <style>
+CUSTOM_CSS = """
     /* Global styles */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
     
@@ -112,55 +119,137 @@ st.markdown("""
         background-color: #fef9c3;
         color: #854d0e;
     }
-    </style>
-""", unsafe_allow_html=True)
+"""
 
-def perform_search(query: str, api_key: str) -> Dict[str, Any]:
-    """Perform search using Serper.dev API"""
+@st.cache_resource
+def load_css() -> str:
+    """Minify the custom CSS once per server process"""
+    css = re.sub(r'/\*.*?\*/', '', CUSTOM_CSS, flags=re.S)
+    return re.sub(r'\s+', ' ', css).strip()
+
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Create a pooled HTTP session shared across reruns"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    return session
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=256)
+def perform_searches(queries: List[str], api_key: str) -> List[Dict[str, Any]]:
+    """Perform several searches in one batched Serper.dev API call"""
     url = "https://google.serper.dev/search"
-    payload = json.dumps({"q": query})
+    payload = json.dumps([{"q": query} for query in queries])
     headers = {
         'X-API-KEY': api_key,
         'Content-Type': 'application/json'
     }
-    response = requests.post(url, headers=headers, data=payload)
+    response = get_session().post(url, headers=headers, data=payload, timeout=10)
+    # Raise on HTTP errors so failed responses are never cached
+    response.raise_for_status()
     return response.json()
 
+def perform_search(query: str, api_key: str) -> Dict[str, Any]:
+    """Perform search using Serper.dev API"""
+    return perform_searches([query], api_key)[0]
+
+@functools.lru_cache(maxsize=4096)
 def get_domain(url: str) -> str:
     """Extract domain from URL"""
+    scheme, sep, rest = url.partition('://')
+    if sep and scheme.isalpha():
+        # Fast path for canonical http(s)://host/... URLs
+        host = rest.partition('/')[0].partition('?')[0].partition('#')[0]
+        return host[4:] if host.startswith('www.') else host
     try:
         parsed = urlparse(url)
         domain = parsed.netloc
-        return domain.replace('www.', '')
-    except:
+        return domain[4:] if domain.startswith('www.') else domain
+    except ValueError:
         return url
 
+def truncate_snippet(snippet: str, limit: int = 150) -> str:
+    """Shorten a snippet for display"""
+    return snippet[:limit] + '...' if len(snippet) > limit else snippet
+
+def build_rows(organic: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Build display rows for organic results in a single pass"""
+    return [{
+        'Position': i+1,
+        'Title': r.get('title', ''),
+        'Domain': get_domain(r['link']),
+        'URL': r['link'],
+        'Snippet': truncate_snippet(r.get('snippet') or '')
+    } for i, r in enumerate(organic)]
+
+def position_differences_by_key(positions1: Dict[str, int], positions2: Dict[str, int]) -> Dict[str, int]:
+    """Absolute position differences for keys present in both rankings"""
+    # Two-pointer walk over key-sorted rankings; avoids building intersection sets
+    a = sorted(positions1.items())
+    b = sorted(positions2.items())
+    differences = {}
+    i = j = 0
+    while i < len(a) and j < len(b):
+        key1, pos1 = a[i]
+        key2, pos2 = b[j]
+        if key1 == key2:
+            differences[key1] = abs(pos1 - pos2)
+            i += 1
+            j += 1
+        elif key1 < key2:
+            i += 1
+        else:
+            j += 1
+    return differences
+
+@st.cache_data(show_spinner=False, max_entries=64)
 def analyze_serp_similarity(results1: Dict[str, Any], results2: Dict[str, Any]) -> Dict:
     """Enhanced SERP analysis with additional metrics"""
     organic1 = results1.get('organic', [])
     organic2 = results2.get('organic', [])
     
+    # Nothing to compare if either query came back empty
+    if not organic1 or not organic2:
+        return {
+            'common_domains': frozenset(),
+            'common_urls': set(),
+            'domain_similarity': 0.0,
+            'url_similarity': 0.0,
+            'position_differences': {},
+            'avg_position_diff': 0,
+            'position_changes': {},
+            'domains1': {},
+            'domains2': {},
+            'rows1': [],
+            'rows2': [],
+            'total_results1': len(organic1),
+            'total_results2': len(organic2)
+        }
+    
+    rows1 = build_rows(organic1)
+    rows2 = build_rows(organic2)
+    
     # Domain analysis
-    domains1 = {get_domain(result['link']): i+1 for i, result in enumerate(organic1)}
-    domains2 = {get_domain(result['link']): i+1 for i, result in enumerate(organic2)}
+    domains1 = {row['Domain']: row['Position'] for row in rows1}
+    domains2 = {row['Domain']: row['Position'] for row in rows2}
     
     # URL analysis
-    urls1 = {result['link']: i+1 for i, result in enumerate(organic1)}
-    urls2 = {result['link']: i+1 for i, result in enumerate(organic2)}
-    
-    common_domains = set(domains1.keys()) & set(domains2.keys())
-    common_urls = set(urls1.keys()) & set(urls2.keys())
+    urls1 = {row['URL']: row['Position'] for row in rows1}
+    urls2 = {row['URL']: row['Position'] for row in rows2}
     
     # Calculate position differences for common domains
-    position_differences = {
-        domain: abs(domains1[domain] - domains2[domain])
-        for domain in common_domains
-    }
+    position_differences = position_differences_by_key(domains1, domains2)
+    common_domains = position_differences.keys()
+    common_urls = urls1.keys() & urls2.keys()
     
     # Calculate advanced metrics
     domain_similarity = len(common_domains) / max(len(domains1), len(domains2)) * 100
     url_similarity = len(common_urls) / max(len(urls1), len(urls2)) * 100
-    avg_position_diff = np.mean(list(position_differences.values())) if position_differences else 0
+    avg_position_diff = (
+        sum(position_differences.values()) / len(position_differences)
+        if position_differences else 0
+    )
     
     # Identify significant position changes
     position_changes = {
@@ -169,12 +258,12 @@ def analyze_serp_similarity(results1: Dict[str, Any], results2: Dict[str, Any])
             'pos2': domains2[domain],
             'diff': domains2[domain] - domains1[domain]
         }
-        for domain in common_domains
-        if abs(domains1[domain] - domains2[domain]) > 2
+        for domain, diff in position_differences.items()
+        if diff > 2
     }
     
     return {
-        'common_domains': common_domains,
+        'common_domains': frozenset(common_domains),
         'common_urls': common_urls,
         'domain_similarity': domain_similarity,
         'url_similarity': url_similarity,
@@ -183,10 +272,38 @@ def analyze_serp_similarity(results1: Dict[str, Any], results2: Dict[str, Any])
         'position_changes': position_changes,
         'domains1': domains1,
         'domains2': domains2,
+        'rows1': rows1,
+        'rows2': rows2,
         'total_results1': len(organic1),
         'total_results2': len(organic2)
     }
 
+def highlight_rows(df: pd.DataFrame, mask: pd.Series, color: str, other: str = '') -> "pd.io.formats.style.Styler":
+    """Style the rows selected by mask with a background color"""
+    styler = df.style.set_properties(
+        subset=pd.IndexSlice[mask, :], **{'background-color': color}
+    )
+    if other:
+        styler = styler.set_properties(
+            subset=pd.IndexSlice[~mask, :], **{'background-color': other}
+        )
+    return styler
+
+def paginate(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Return the slice of df for the page selected by the user"""
+    if len(df) <= PAGE_SIZE:
+        return df
+    pages = math.ceil(len(df) / PAGE_SIZE)
+    page = st.number_input(
+        f"Page (of {pages}):",
+        min_value=1,
+        max_value=pages,
+        value=1,
+        key=key
+    )
+    start = (page - 1) * PAGE_SIZE
+    return df.iloc[start:start + PAGE_SIZE]
+
 def main():
     st.markdown("""
         <div style='text-align: center; padding: 2rem 0;'>
@@ -217,133 +334,142 @@ def main():
             query2 = st.text_input("Second Query:", placeholder="e.g., apple company")
         
         if st.button("🔍 Compare Results"):
+            for key in ('results1_page', 'results2_page'):
+                st.session_state.pop(key, None)
             try:
                 with st.spinner("Analyzing search results..."):
-                    # Perform searches
-                    results1 = perform_search(query1, api_key)
-                    results2 = perform_search(query2, api_key)
-                    
-                    # Analyze similarities
-                    similarity = analyze_serp_similarity(results1, results2)
-                    
-                    # Display key metrics
-                    m1, m2, m3 = st.columns(3)
-                    with m1:
-                        st.metric("Domain Similarity", f"{similarity['domain_similarity']:.1f}%")
-                    with m2:
-                        st.metric("URL Similarity", f"{similarity['url_similarity']:.1f}%")
-                    with m3:
-                        st.metric("Avg. Position Difference", f"{similarity['avg_position_diff']:.1f}")
-                    
-                    # Results comparison
-                    col1, col2 = st.columns(2)
-                    
-                    # Process results with enhanced information
-                    def process_results(results, other_domains):
-                        return pd.DataFrame([{
-                            'Position': i+1,
-                            'Title': r.get('title', ''),
-                            'Domain': get_domain(r['link']),
-                            'URL': r['link'],
-                            'Status': 'Common' if get_domain(r['link']) in other_domains else 'Unique',
-                            'Snippet': r.get('snippet', '')[:150] + '...' if r.get('snippet') else ''
-                        } for i, r in enumerate(results.get('organic', []))])
-                    
-                    df1 = process_results(results1, similarity['domains2'])
-                    df2 = process_results(results2, similarity['domains1'])
-                    
-                    # Display results with position change highlighting
-                    with col1:
-                        st.markdown(f"### Results for: {query1}")
-                        st.dataframe(
-                            df1.style.apply(lambda x: [
-                                'background-color: #dcfce7' if x['Status'] == 'Common' else ''
-                                for i in range(len(x))
-                            ], axis=1),
-                            use_container_width=True
-                        )
-                    
-                    with col2:
-                        st.markdown(f"### Results for: {query2}")
-                        st.dataframe(
-                            df2.style.apply(lambda x: [
-                                'background-color: #dcfce7' if x['Status'] == 'Common' else ''
-                                for i in range(len(x))
-                            ], axis=1),
-                            use_container_width=True
-                        )
-                    
-                    # Position Changes Analysis
-                    if similarity['position_changes']:
-                        st.markdown("### 📊 Significant Position Changes")
-                        changes_df = pd.DataFrame([
-                            {
-                                'Domain': domain,
-                                'Position in Query 1': data['pos1'],
-                                'Position in Query 2': data['pos2'],
-                                'Change': data['diff']
-                            }
-                            for domain, data in similarity['position_changes'].items()
-                        ]).sort_values('Change', ascending=False)
-                        
-                        st.dataframe(
-                            changes_df.style.apply(lambda x: [
-                                'background-color: #fef9c3' if x['Change'] > 0 else 'background-color: #fee2e2'
-                                for i in range(len(x))
-                            ], axis=1),
-                            use_container_width=True
-                        )
-                    
-                    # Common Elements Section
-                    st.markdown("### 🔍 Common Elements")
-                    common_col1, common_col2 = st.columns(2)
-                    
-                    with common_col1:
-                        st.markdown("#### 🌐 Common Domains")
-                        if similarity['common_domains']:
-                            for domain in sorted(similarity['common_domains']):
-                                st.markdown(f"""
-                                    <div style='
-                                        background: #f0f9ff;
-                                        padding: 0.5rem 1rem;
-                                        border-radius: 0.5rem;
-                                        margin: 0.25rem 0;
-                                        border: 1px solid #bae6fd;
-                                        font-family: monospace;
-                                    '>
-                                        {domain}
-                                    </div>
-                                """, unsafe_allow_html=True)
-                        else:
-                            st.info("No common domains found")
+                    # Perform both searches in a single request
+                    results1, results2 = perform_searches([query1, query2], api_key)
+                # Keep the fetched results so reruns render without refetching
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                st.session_state['comparison'] = (query1, query2, results1, results2, timestamp)
+            except Exception as e:
+                st.session_state.pop('comparison', None)
+                st.error("An error occurred during analysis")
+                with st.expander("View Error Details"):
+                    st.code(str(e))
+        
+        if 'comparison' in st.session_state:
+            query1, query2, results1, results2, timestamp = st.session_state['comparison']
+            try:
+                # Analyze similarities
+                similarity = analyze_serp_similarity(results1, results2)
+                
+                if not similarity['total_results1'] or not similarity['total_results2']:
+                    empty = [q for q, n in ((query1, similarity['total_results1']),
+                                            (query2, similarity['total_results2'])) if not n]
+                    st.warning(f"No organic results returned for: {', '.join(empty)}")
+                    return
+                
+                # Display key metrics
+                m1, m2, m3 = st.columns(3)
+                with m1:
+                    st.metric("Domain Similarity", f"{similarity['domain_similarity']:.1f}%")
+                with m2:
+                    st.metric("URL Similarity", f"{similarity['url_similarity']:.1f}%")
+                with m3:
+                    st.metric("Avg. Position Difference", f"{similarity['avg_position_diff']:.1f}")
+                
+                # Results comparison
+                col1, col2 = st.columns(2)
+                
+                # Process results with enhanced information
+                def process_results(rows, common_domains):
+                    df = pd.DataFrame(rows, columns=['Position', 'Title', 'Domain', 'URL', 'Snippet'])
+                    df.insert(4, 'Status', np.where(
+                        df['Domain'].isin(common_domains), 'Common', 'Unique'
+                    ))
+                    return df
+                
+                df1 = process_results(similarity['rows1'], similarity['common_domains'])
+                df2 = process_results(similarity['rows2'], similarity['common_domains'])
+                
+                # Display results with position change highlighting
+                with col1:
+                    st.markdown(f"### Results for: {query1}")
+                    page1 = paginate(df1, 'results1_page')
+                    st.dataframe(
+                        highlight_rows(page1, page1['Status'].eq('Common'), '#dcfce7'),
+                        use_container_width=True
+                    )
+                
+                with col2:
+                    st.markdown(f"### Results for: {query2}")
+                    page2 = paginate(df2, 'results2_page')
+                    st.dataframe(
+                        highlight_rows(page2, page2['Status'].eq('Common'), '#dcfce7'),
+                        use_container_width=True
+                    )
+                
+                # Position Changes Analysis
+                if similarity['position_changes']:
+                    st.markdown("### 📊 Significant Position Changes")
+                    changes_df = pd.DataFrame([
+                        {
+                            'Domain': domain,
+                            'Position in Query 1': data['pos1'],
+                            'Position in Query 2': data['pos2'],
+                            'Change': data['diff']
+                        }
+                        for domain, data in similarity['position_changes'].items()
+                    ]).sort_values('Change', ascending=False)
                     
-                    with common_col2:
-                        st.markdown("#### 🔗 Exact URL Matches")
-                        if similarity['common_urls']:
-                            for url in sorted(similarity['common_urls']):
-                                st.markdown(f"""
-                                    <div style='
-                                        background: #f0f9ff;
-                                        padding: 0.5rem 1rem;
-                                        border-radius: 0.5rem;
-                                        margin: 0.25rem 0;
-                                        border: 1px solid #bae6fd;
-                                        overflow-wrap: break-word;
+                    st.dataframe(
+                        highlight_rows(changes_df, changes_df['Change'].gt(0), '#fef9c3', '#fee2e2'),
+                        use_container_width=True
+                    )
+                
+                # Common Elements Section
+                st.markdown("### 🔍 Common Elements")
+                common_col1, common_col2 = st.columns(2)
+                
+                with common_col1:
+                    st.markdown("#### 🌐 Common Domains")
+                    if similarity['common_domains']:
+                        domains_html = "".join(f"""
+                                <div style='
+                                    background: #f0f9ff;
+                                    padding: 0.5rem 1rem;
+                                    border-radius: 0.5rem;
+                                    margin: 0.25rem 0;
+                                    border: 1px solid #bae6fd;
+                                    font-family: monospace;
+                                '>
+                                    {domain}
+                                </div>
+                            """ for domain in sorted(similarity['common_domains']))
+                        st.markdown(domains_html, unsafe_allow_html=True)
+                    else:
+                        st.info("No common domains found")
+                
+                with common_col2:
+                    st.markdown("#### 🔗 Exact URL Matches")
+                    if similarity['common_urls']:
+                        urls_html = "".join(f"""
+                                <div style='
+                                    background: #f0f9ff;
+                                    padding: 0.5rem 1rem;
+                                    border-radius: 0.5rem;
+                                    margin: 0.25rem 0;
+                                    border: 1px solid #bae6fd;
+                                    overflow-wrap: break-word;
+                                '>
+                                    <a href="{url}" target="_blank" style='
+                                        color: #2563eb;
+                                        text-decoration: none;
+                                        font-size: 0.875rem;
                                     '>
-                                        <a href="{url}" target="_blank" style='
-                                            color: #2563eb;
-                                            text-decoration: none;
-                                            font-size: 0.875rem;
-                                        '>
-                                            {url}
-                                        </a>
-                                    </div>
-                                """, unsafe_allow_html=True)
-                        else:
-                            st.info("No exact URL matches found")
-                    
-                    # Export results
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                                        {url}
+                                    </a>
+                                </div>
+                            """ for url in sorted(similarity['common_urls']))
+                        st.markdown(urls_html, unsafe_allow_html=True)
+                    else:
+                        st.info("No exact URL matches found")
+                
+                # Export results
+                # Built only when the user clicks the download button
+                def make_export():
                     export_data = {
                         'analysis_time': timestamp,
                         'queries': {'query1': query1, 'query2': query2},
@@ -358,15 +484,17 @@ def main():
                         'common_domains': list(similarity['common_domains']),
                         'common_urls': list(similarity['common_urls'])
                     }
-                    
-                    st.download_button(
-                        label="📥 Export Analysis",
-                        data=json.dumps(export_data, indent=2),
-                        file_name=f"serp_analysis_{timestamp}.json",
-                        mime="application/json"
-                    )
-                    
+                    return orjson.dumps(export_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+                
+                st.download_button(
+                    label="📥 Export Analysis",
+                    data=make_export,
+                    file_name=f"serp_analysis_{timestamp}.json",
+                    mime="application/json"
+                )
+                
             except Exception as e:
+                st.session_state.pop('comparison', None)
                 st.error("An error occurred during analysis")
                 with st.expander("View Error Details"):
                     st.code(str(e))